@@ -0,0 +1,148 @@
+# -*- encoding=utf8 -*-
+# async_logging.py - 非阻塞日志 (客户端与视觉服务器共用)
+#
+# - 调用线程只创建 LogRecord 并入队，格式化和 I/O 都在后台线程完成
+# - 标记为 SAMPLED 的逐帧日志按 (logger, 设备, 消息模板) 限流，超出部分只计数
+# - DeviceLogger 支持按设备单独设置日志级别 (每台设备一个子 logger)，级别不够时连 LogRecord 都不创建
+import queue
+import atexit
+import logging
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional, Union
+
+# 逐帧重复日志加上 extra=SAMPLED 即参与限流
+SAMPLED = {"sampled": True}
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    不在调用线程格式化的 QueueHandler：
+    标准 QueueHandler.prepare() 会先把消息格式化好再入队，这里原样入队，交给后台线程处理。
+    队列满时丢弃并计数，绝不阻塞调用方。
+    """
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return
+        if self.dropped:
+            with self._lock:
+                dropped, self.dropped = self.dropped, 0
+            if dropped:
+                notice = logging.LogRecord(record.name, logging.WARNING, __file__, 0,
+                                           "日志队列已满，丢弃了 %d 条日志", (dropped,), None)
+                try:
+                    self.queue.put_nowait(notice)
+                except queue.Full:
+                    with self._lock:
+                        self.dropped += dropped
+
+
+class SamplingFilter(logging.Filter):
+    """
+    对带 sampled 标记的日志限流：同一 (logger, 设备, 消息模板) 每 interval 秒最多放行 burst 条，
+    下一个窗口放行的第一条日志后面附上被省略的条数。
+    """
+    def __init__(self, interval: float = 1.0, burst: int = 3):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._windows = {}   # key -> [窗口开始时间, 已放行条数, 被省略条数]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "sampled", False):
+            return True
+        key = (record.name, getattr(record, "device", None), record.msg)
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or record.created - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [record.created, 1, 0]
+                if suppressed:
+                    record.msg = f"{record.msg} (前 {self.interval:g}s 内省略 {suppressed} 条同类日志)"
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+class DeviceLogger(logging.LoggerAdapter):
+    """
+    按设备设置日志级别的 LoggerAdapter，同时给每条日志带上 device 属性。
+    级别设在该设备自己的子 logger (如 Bot.emulator-5554) 上，不影响共享的父 logger 和其他设备。
+    """
+    def __init__(self, logger: logging.Logger, device_id: Optional[str], level: Union[int, str] = logging.INFO):
+        if device_id is not None:
+            # 设备 ID 里的 "." (如 192.168.1.20:5555) 会被当成 logger 层级
+            logger = logger.getChild(str(device_id).replace(".", "_"))
+            logger.setLevel(level if isinstance(level, int) else level.upper())
+        super().__init__(logger, {"device": device_id})
+
+    def process(self, msg, kwargs):
+        kwargs["extra"] = {**self.extra, **kwargs.get("extra", {})}
+        return msg, kwargs
+
+
+_listener = None
+
+
+def _stop_listener():
+    """退出前把队列里剩余的日志写完"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(_stop_listener)
+
+
+def flush_logs(timeout: float = 1.0):
+    """等待后台线程写完已入队的日志 (交互式 input() 之前调用，避免提示与日志交错)"""
+    if _listener is None:
+        return
+    deadline = time.time() + timeout
+    while _listener.queue.unfinished_tasks and time.time() < deadline:
+        time.sleep(0.005)
+
+
+def setup_logging(level: Union[int, str] = logging.INFO, fmt: str = "%(asctime)s - [%(levelname)s] - %(message)s",
+                  queue_size: int = 10000, sample_interval: float = 1.0, sample_burst: int = 3) -> QueueListener:
+    """
+    替代 logging.basicConfig：根 logger 只挂一个入队 handler，
+    真正的 StreamHandler 由后台 QueueListener 线程调用。
+    """
+    global _listener
+    _stop_listener()
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(fmt))
+
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_interval, sample_burst))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    return _listener
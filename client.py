@@ -10,21 +10,55 @@ import logging
 import subprocess
 import shlex
 import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from typing import List, Tuple, Optional
 from multiprocessing import Process
+from flight_recorder import FlightRecorder
+from async_logging import setup_logging, flush_logs, DeviceLogger, SAMPLED
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
 
 # ================= 0. 环境日志配置 =================
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - [%(levelname)s] - %(message)s')
+# 实际的 handler 在 Config 之后由 setup_logging 安装 (需要 Config.LOG_LEVEL)
 logger = logging.getLogger("Bot")
 
-def run_server():
+def run_server(port: int = 9000):
     import uvicorn
     from wechat_like_cv_server import app  # 假设你的 server 文件名为 wechat_like_cv_server.py
-    uvicorn.run(app, host="0.0.0.0", port=9000, log_level="info")
+    # 访问日志在事件循环里同步逐条写出，压力大时拖慢请求，这里关掉
+    uvicorn.run(app, host="0.0.0.0", port=port, log_level="info", access_log=False)
     
 # ================= 1. 工业级配置 =================
 class Config:
     SERVER_URL = "http://localhost:9000/vision/process"  # 默认本地
+    # 多服务器端点 (可跨进程/跨机器)，例如:
+    # ["http://localhost:9000/vision/process", "http://localhost:9001/vision/process", "http://192.168.1.20:9000/vision/process"]
+    SERVER_URLS = [SERVER_URL]
+
+    # --- 服务器连接池 ---
+    SERVER_POOL_SIZE = 8             # 所有设备共享的最大并发连接数
+    SERVER_CONNECT_TIMEOUT = 1.0     # 连接超时 (秒)
+    SERVER_READ_TIMEOUT = 5.0        # 读取超时 (秒)
+    SERVER_MAX_FAILURES = 3          # 连续失败多少次后剔除节点
+    SERVER_EJECT_SECONDS = 15.0      # 节点被剔除的冷却时间
+    SERVER_MAX_ATTEMPTS = 2          # 连接失败/5xx 时单次请求最多尝试几个节点 (读取超时不重发)
+    SIFT_RECORD_DIR = None           # 设置目录后保存发给服务器的图片对，供 load_test.py --pairs 回放
+
+    # --- 共享FFT多模板匹配 ---
+    MULTISCALE_SCALES = np.linspace(0.5, 2.0, 15)
+    MULTISCALE_MIN_CONF = 0.65
+    FFT_CACHE_MB = 64               # 模板频谱缓存上限 (整个进程共享，满了之后的模板改走 cv2.matchTemplate)
+    FFT_MIN_TEMPLATE_RATIO = 0.01   # 模板面积不到搜索区域的该比例时 cv2.matchTemplate 更快
+
+    # --- 本地/服务器对冲匹配 ---
+    HEDGE_PARALLEL = False          # True: 本地和服务器同时开跑; False: 先跑统计上更优的一方
+    HEDGE_LATENCY_BUDGET = 0.4      # 先跑的一方超过该耗时 (秒) 仍无结果，就启动另一方
+    HEDGE_CONFIDENT_CONF = 0.8      # 本地结果置信度达到该值才算“确定”，否则继续等服务器
+    HEDGE_STATS_ALPHA = 0.2         # 耗时/命中率统计的滑动平均系数
+    HEDGE_EXPLORE_RATE = 0.1        # 按该概率让统计上较差的一方先跑，使它的统计能跟上变化
+    HEDGE_LOCAL_WORKERS = 4         # 所有设备共享的本地匹配线程数 (CPU 密集)
+    HEDGE_SERVER_WORKERS = 8        # 所有设备共享的服务器请求线程数 (输掉的请求无法中止，会占着线程直到返回)
     
     SEEDS = {
         "dots": "two_dots_orig.png", 
@@ -64,15 +98,31 @@ class Config:
     TEMP_SCREENSHOT = "/sdcard/bot_screenshot_temp.jpg"
     LOCAL_SCREENSHOT = "temp_screenshot.jpg"
 
+    # --- 飞行记录仪 (最近 N 帧 + 检测结果 + 耗时 + 动作，事后用 flight_recorder.py 导出) ---
+    FLIGHT_RECORDER_ENABLED = True
+    FLIGHT_RECORDER_DIR = "flight_records"
+    FLIGHT_RECORDER_SLOTS = 64          # 每设备保留的帧数
+    FLIGHT_RECORDER_FRAME_WIDTH = 270   # 缩略图宽度
+    FLIGHT_RECORDER_FRAME_MAX_HEIGHT = 640
+
+    # --- 日志 ---
+    LOG_LEVEL = "INFO"
+    DEVICE_LOG_LEVELS = {}   # 按设备覆盖日志级别，如 {"emulator-5554": "DEBUG", "R58M123": "WARNING"}
+
     # CV 配置文件
     CV_CONFIG_FILE = "cv_config.json"
 
+# 格式化和写出都在后台线程完成，逐帧日志 (extra=SAMPLED) 会被限流
+setup_logging(level=Config.LOG_LEVEL, fmt='%(asctime)s - [%(levelname)s] - %(message)s')
+
 # ================= 2. ADB设备管理器 =================
 class ADBManager:
     def __init__(self, device_id: str = None):
         self.device_id = device_id
         self.width = 0
         self.height = 0
+        self.action_log = None  # 设置为列表时，记录每个 tap/swipe 动作 (供飞行记录仪使用)
+        self.log = DeviceLogger(logger, device_id, Config.DEVICE_LOG_LEVELS.get(device_id, Config.LOG_LEVEL))
         if device_id:
             self._get_device_resolution()
 
@@ -96,14 +146,14 @@ class ADBManager:
             if result.returncode == 0:
                 return True, result.stdout.strip()
             else:
-                logger.error(f"ADB命令执行失败 ({self.device_id}): {full_cmd}")
-                logger.error(f"错误信息: {result.stderr}")
+                self.log.error("ADB命令执行失败 (%s): %s", self.device_id, full_cmd)
+                self.log.error("错误信息: %s", result.stderr)
                 return False, result.stderr
         except subprocess.TimeoutExpired:
-            logger.error(f"ADB命令超时 ({self.device_id}): {full_cmd}")
+            self.log.error("ADB命令超时 (%s): %s", self.device_id, full_cmd)
             return False, "Timeout"
         except Exception as e:
-            logger.error(f"ADB命令执行异常 ({self.device_id}): {e}")
+            self.log.error("ADB命令执行异常 (%s): %s", self.device_id, e)
             return False, str(e)
 
     @staticmethod
@@ -128,7 +178,7 @@ class ADBManager:
             
             return devices
         except Exception as e:
-            logger.error(f"列出设备失败: {e}")
+            logger.error("列出设备失败: %s", e)
             return []
 
     def _get_device_resolution(self):
@@ -139,12 +189,12 @@ class ADBManager:
             width, height = map(int, size_str.split("x"))
             self.width = width
             self.height = height
-            logger.info(f"📏 设备 {self.device_id} 分辨率: {width}x{height}")
+            self.log.info("📏 设备 %s 分辨率: %sx%s", self.device_id, width, height)
         else:
             # 默认分辨率
             self.width = 1080
             self.height = 2400
-            logger.warning(f"⚠️ 设备 {self.device_id} 获取分辨率失败，使用默认值: {self.width}x{self.height}")
+            self.log.warning("⚠️ 设备 %s 获取分辨率失败，使用默认值: %sx%s", self.device_id, self.width, self.height)
 
     def screenshot(self) -> Optional[np.ndarray]:
         """获取屏幕截图并返回OpenCV格式的图像"""
@@ -155,13 +205,13 @@ class ADBManager:
         local_path = f"temp_screenshot_{self.device_id}.jpg" if self.device_id else Config.LOCAL_SCREENSHOT
         success, _ = self.run_adb_command(f"pull {Config.TEMP_SCREENSHOT} {local_path}")
         if not success:
-            logger.error(f"❌ 设备 {self.device_id} 拉取截图失败")
+            self.log.error("❌ 设备 %s 拉取截图失败", self.device_id)
             return None
         
         # 3. 读取并返回
         img = cv2.imread(local_path)
         if img is None:
-            logger.error(f"❌ 设备 {self.device_id} 读取截图失败")
+            self.log.error("❌ 设备 %s 读取截图失败", self.device_id)
             return None
         
         return img
@@ -171,19 +221,311 @@ class ADBManager:
         # 添加随机偏移，更接近真人操作
         x += random.randint(-2, 2)
         y += random.randint(-2, 2)
+        if self.action_log is not None:
+            self.action_log.append(("tap", x, y))
         self.run_adb_command(f"shell input tap {x} {y}")
 
     def swipe(self, start_x: int, start_y: int, end_x: int, end_y: int, duration: float = 0.8):
         """模拟滑动操作"""
         # duration单位：秒 -> 转换为ADB需要的毫秒
         duration_ms = int(duration * 1000)
+        if self.action_log is not None:
+            self.action_log.append(("swipe", start_x, start_y, end_x, end_y))
         self.run_adb_command(f"shell input swipe {start_x} {start_y} {end_x} {end_y} {duration_ms}")
 
-# ================= 3. 视觉闭环系统 =================
-class VisualServo:
-    def __init__(self, adb_manager: ADBManager):
+# ================= 3. 视觉服务器连接池 =================
+class ServerEndpoint:
+    """单个视觉服务器节点的运行状态"""
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0            # 未完成请求数 (用于负载均衡)
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0        # 被剔除直到该时间点
+        self.total_requests = 0
+        self.total_failures = 0
+
+    def is_available(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+
+class ServerPool:
+    """
+    多节点视觉服务器池：
+    - 所有设备共享一个有界连接池 (requests.Session + HTTPAdapter)
+    - 最少未完成请求 (least-outstanding-requests) 负载均衡
+    - 连续失败的节点被临时剔除，冷却后半开重试
+    - 连接失败/5xx 时换一个节点重试；读取超时只计入失败、不重发，避免过载时把 SIFT 任务翻倍
+    """
+    def __init__(self, urls: List[str],
+                 pool_size: int = Config.SERVER_POOL_SIZE,
+                 max_failures: int = Config.SERVER_MAX_FAILURES,
+                 eject_seconds: float = Config.SERVER_EJECT_SECONDS,
+                 max_attempts: int = Config.SERVER_MAX_ATTEMPTS):
+        if not urls:
+            raise ValueError("ServerPool 至少需要一个服务器地址")
+        self.endpoints = [ServerEndpoint(url) for url in urls]
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self.max_attempts = max(1, max_attempts)
+        self._lock = threading.Lock()
+        # 限制全局并发，超过时排队等待而不是无限开连接
+        self._slots = threading.BoundedSemaphore(pool_size)
+
         self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.endpoints), pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _acquire_endpoint(self, exclude: set) -> Optional[ServerEndpoint]:
+        """选出未完成请求最少的健康节点；全部被剔除时选最早恢复的节点做半开探测"""
+        now = time.time()
+        with self._lock:
+            candidates = [ep for ep in self.endpoints if ep.url not in exclude]
+            if not candidates:
+                return None
+            healthy = [ep for ep in candidates if ep.is_available(now)]
+            if healthy:
+                least = min(ep.outstanding for ep in healthy)
+                endpoint = random.choice([ep for ep in healthy if ep.outstanding == least])
+            else:
+                endpoint = min(candidates, key=lambda ep: ep.ejected_until)
+            endpoint.outstanding += 1
+            endpoint.total_requests += 1
+            return endpoint
+
+    def _release_endpoint(self, endpoint: ServerEndpoint, ok: bool):
+        with self._lock:
+            endpoint.outstanding -= 1
+            if ok:
+                endpoint.consecutive_failures = 0
+                endpoint.ejected_until = 0.0
+                return
+            endpoint.total_failures += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= self.max_failures:
+                endpoint.ejected_until = time.time() + self.eject_seconds
+                logger.warning("🚫 CV服务器节点被剔除 %.0fs: %s (连续失败 %d 次)",
+                               self.eject_seconds, endpoint.url, endpoint.consecutive_failures)
+
+    @staticmethod
+    def _is_connect_error(e: requests.RequestException) -> bool:
+        """请求还没送到服务器 (连接超时/拒绝)，换节点重发是安全的"""
+        if isinstance(e, requests.ConnectTimeout):
+            return True
+        if isinstance(e, requests.ConnectionError) and e.args:
+            return isinstance(getattr(e.args[0], "reason", None), NewConnectionError)
+        return False
+
+    def post(self, data: dict, files: dict, timeout=None) -> Optional[requests.Response]:
+        """发送请求，连接失败/5xx 时换节点重试；失败返回 None"""
+        if timeout is None:
+            timeout = (Config.SERVER_CONNECT_TIMEOUT, Config.SERVER_READ_TIMEOUT)
+        tried = set()
+        with self._slots:
+            for _ in range(min(self.max_attempts, len(self.endpoints))):
+                endpoint = self._acquire_endpoint(tried)
+                if endpoint is None:
+                    break
+                tried.add(endpoint.url)
+                try:
+                    resp = self.session.post(endpoint.url, data=data, files=files, timeout=timeout)
+                except requests.RequestException as e:
+                    self._release_endpoint(endpoint, ok=False)
+                    logger.warning("⚠️ CV服务器节点请求失败: %s (%s)", endpoint.url, e, extra=SAMPLED)
+                    if self._is_connect_error(e):
+                        continue
+                    # 读取超时等：节点可能已在处理该任务，不再重发
+                    return None
+                if resp.status_code >= 500:
+                    self._release_endpoint(endpoint, ok=False)
+                    logger.warning("⚠️ CV服务器节点返回 %s: %s", resp.status_code, endpoint.url, extra=SAMPLED)
+                    continue
+                self._release_endpoint(endpoint, ok=True)
+                return resp
+        return None
+
+    def stats(self) -> List[dict]:
+        with self._lock:
+            now = time.time()
+            return [{"url": ep.url, "outstanding": ep.outstanding, "requests": ep.total_requests,
+                     "failures": ep.total_failures, "healthy": ep.is_available(now)}
+                    for ep in self.endpoints]
+
+
+_server_pool = None
+_server_pool_lock = threading.Lock()
+
+def get_server_pool() -> ServerPool:
+    """进程内所有设备共享同一个服务器池"""
+    global _server_pool
+    with _server_pool_lock:
+        if _server_pool is None:
+            _server_pool = ServerPool(Config.SERVER_URLS)
+        return _server_pool
+
+# ================= 4. 共享FFT多模板匹配 =================
+class MatchCancelled(Exception):
+    """匹配因 cancel_event 被置位而中途放弃 (区别于跑完了但没找到)"""
+
+
+class SharedFFTMatcher:
+    """
+    多模板共享 FFT 的归一化相关匹配 (结果等价于 cv2.TM_CCOEFF_NORMED)：
+    - 每帧灰度图 (或其中一个横向条带) 只做一次正向 DFT，参与的模板共用帧频谱
+    - 模板频谱按帧尺寸缓存，总量受 cache_mb 限制；缓存满了就不再收新频谱 (不做 LRU 淘汰，
+      多尺度模板轮流匹配时 LRU 会反复换出，一次都命中不了)
+    - 滑窗方差用盒式滤波计算，同尺寸模板共享
+    只有一个模板、模板面积不到帧 (条带) 面积的 min_template_ratio、或频谱没进缓存时
+    直接用 cv2.matchTemplate，这些情况下 FFT 反而更慢 (整屏找小图标就属于这种)。
+    进程内所有设备共用一个实例 (get_fft_matcher)。
+    """
+    FLAT_VARIANCE = 0.1   # 滑窗像素方差低于该值视为纯色窗口，响应记为 0 (与 cv2 一致)
+
+    def __init__(self, cache_mb: int = Config.FFT_CACHE_MB,
+                 min_template_ratio: float = Config.FFT_MIN_TEMPLATE_RATIO):
+        self.cache_bytes = cache_mb * 1024 * 1024
+        self.min_template_ratio = min_template_ratio
+        self._templates = {}   # name -> (灰度模板, 零均值模板, 模板范数)
+        self._spectra = {}     # (name, fft_shape) -> 模板频谱 (CCS 格式)
+        self._spectra_bytes = 0
+        self._lock = threading.Lock()
+
+    def register(self, name: str, gray_tpl: np.ndarray):
+        """注册 (或替换) 一个灰度模板"""
+        tpl = gray_tpl.astype(np.float32)
+        tpl -= tpl.mean()
+        norm = float(np.sqrt(np.sum(tpl.astype(np.float64) ** 2)))
+        with self._lock:
+            self._templates[name] = (gray_tpl, tpl, norm)
+            for key in [k for k in self._spectra if k[0] == name]:
+                self._spectra_bytes -= self._spectra.pop(key).nbytes
+
+    def has(self, name: str) -> bool:
+        return name in self._templates
+
+    def template_shape(self, name: str) -> Tuple[int, int]:
+        return self._templates[name][0].shape[:2]
+
+    def _template_spectrum(self, name: str, fft_shape: Tuple[int, int]) -> Optional[np.ndarray]:
+        """返回缓存的模板频谱；缓存已满放不下时返回 None"""
+        key = (name, fft_shape)
+        nbytes = fft_shape[0] * fft_shape[1] * 4
+        with self._lock:
+            spec = self._spectra.get(key)
+            if spec is not None or self._spectra_bytes + nbytes > self.cache_bytes:
+                return spec
+            tpl = self._templates[name][1]
+        h, w = tpl.shape[:2]
+        padded = np.zeros(fft_shape, np.float32)
+        padded[:h, :w] = tpl
+        spec = cv2.dft(padded, nonzeroRows=h)
+        with self._lock:
+            if key in self._spectra:
+                return self._spectra[key]
+            if self._spectra_bytes + spec.nbytes > self.cache_bytes:
+                return None
+            self._spectra[key] = spec
+            self._spectra_bytes += spec.nbytes
+        return spec
+
+    def _match_direct(self, gray: np.ndarray, name: str) -> np.ndarray:
+        gray_tpl, _, norm = self._templates[name]
+        if norm < 1e-6:
+            # 纯色模板无法做归一化相关 (cv2 会返回全 1)
+            h, w = gray_tpl.shape[:2]
+            return np.zeros((gray.shape[0] - h + 1, gray.shape[1] - w + 1), np.float32)
+        return cv2.matchTemplate(gray, gray_tpl, cv2.TM_CCOEFF_NORMED)
+
+    def _inv_window_std(self, frame: np.ndarray, h: int, w: int) -> np.ndarray:
+        """每个滑窗去均值后范数的倒数 (纯色窗口记为 0)"""
+        H, W = frame.shape[:2]
+        box = dict(anchor=(0, 0), normalize=True, borderType=cv2.BORDER_CONSTANT)
+        win_mean = cv2.boxFilter(frame, cv2.CV_32F, (w, h), **box)[:H - h + 1, :W - w + 1]
+        win_sq = cv2.sqrBoxFilter(frame, cv2.CV_32F, (w, h), **box)[:H - h + 1, :W - w + 1]
+        variance = cv2.subtract(win_sq, cv2.multiply(win_mean, win_mean))
+        _, valid = cv2.threshold(variance, self.FLAT_VARIANCE, 1.0, cv2.THRESH_BINARY)
+        std = cv2.sqrt(cv2.max(variance, self.FLAT_VARIANCE))
+        return cv2.divide(valid, std, scale=1.0 / np.sqrt(h * w))
+
+    def match(self, gray: np.ndarray, names: Optional[List[str]] = None,
+              band: Optional[Tuple[int, int]] = None,
+              cancel_event: Optional[threading.Event] = None) -> dict:
+        """
+        对一帧灰度图匹配多个模板，返回 {name: 归一化响应图}。
+        band=(y1, y2) 时只在该横向条带内匹配，响应图坐标相对于条带顶部。
+        比帧 (条带) 还大的模板会被跳过；cancel_event 被置位时在模板之间抛出 MatchCancelled。
+        """
+        if band is not None:
+            gray = gray[max(0, band[0]):band[1], :]
+        H, W = gray.shape[:2]
+        if names is None:
+            names = list(self._templates)
+        names = [n for n in names if n in self._templates
+                 and self.template_shape(n)[0] <= H and self.template_shape(n)[1] <= W]
+        if not names:
+            return {}
+
+        fft_shape = (cv2.getOptimalDFTSize(H), cv2.getOptimalDFTSize(W))
+        spectra = {}
+        if len(names) > 1:
+            for name in names:
+                h, w = self.template_shape(name)
+                if h * w >= self.min_template_ratio * H * W:
+                    spec = self._template_spectrum(name, fft_shape)
+                    if spec is not None:
+                        spectra[name] = spec
+        if len(spectra) < 2:
+            # 帧的正向 DFT 摊不薄
+            spectra = {}
+
+        frame = frame_spec = None
+        inv_std_cache = {}
+        results = {}
+        for name in names:
+            if cancel_event is not None and cancel_event.is_set():
+                raise MatchCancelled()
+            if name not in spectra:
+                results[name] = self._match_direct(gray, name)
+                continue
+            _, tpl, norm = self._templates[name]
+            h, w = tpl.shape[:2]
+            if norm < 1e-6:
+                results[name] = np.zeros((H - h + 1, W - w + 1), np.float32)
+                continue
+            if frame_spec is None:
+                # 去掉全局均值：零均值模板的相关结果不变，float32 精度更好
+                frame = gray.astype(np.float32)
+                frame -= frame.mean()
+                padded = np.zeros(fft_shape, np.float32)
+                padded[:H, :W] = frame
+                frame_spec = cv2.dft(padded, nonzeroRows=H)
+            corr = cv2.idft(cv2.mulSpectrums(frame_spec, spectra[name], 0, conjB=True),
+                            flags=cv2.DFT_SCALE | cv2.DFT_REAL_OUTPUT)
+            if (h, w) not in inv_std_cache:
+                inv_std_cache[(h, w)] = self._inv_window_std(frame, h, w)
+            res = cv2.multiply(corr[:H - h + 1, :W - w + 1], inv_std_cache[(h, w)], scale=1.0 / norm)
+            results[name] = np.clip(res, -1.0, 1.0, out=res)
+        return results
+
+
+_fft_matcher = None
+_fft_matcher_lock = threading.Lock()
+
+def get_fft_matcher() -> SharedFFTMatcher:
+    """进程内所有设备共享同一个匹配器，种子模板的频谱只缓存一份"""
+    global _fft_matcher
+    with _fft_matcher_lock:
+        if _fft_matcher is None:
+            _fft_matcher = SharedFFTMatcher()
+        return _fft_matcher
+
+# ================= 5. 视觉闭环系统 =================
+class VisualServo:
+    def __init__(self, adb_manager: ADBManager, server_pool: Optional[ServerPool] = None):
+        self.server_pool = server_pool or get_server_pool()
         self.adb_manager = adb_manager
+        self.log = adb_manager.log
+        self.fft_matcher = get_fft_matcher()
     
     def get_screen_cv(self):
         return self.adb_manager.screenshot()
@@ -228,53 +570,92 @@ class VisualServo:
         # 3. 按 Y 坐标排序 (从上到下)
         targets.sort(key=lambda p: p[1])
         
-        if targets:
+        if targets and self.log.isEnabledFor(logging.INFO):
             log_str = " | ".join([f"Y={t[1]}" for t in targets])
-            logger.info(f"🔎 [{self.adb_manager.device_id}] 发现 {len(targets)} 个独立目标: [{log_str}]")
+            self.log.info("🔎 [%s] 发现 %s 个独立目标: [%s]", self.adb_manager.device_id, len(targets), log_str, extra=SAMPLED)
             
         return targets
 
-    def multiscale_match(self, screen, template_path):
-        if not os.path.exists(template_path): return None
-        tpl = cv2.imread(template_path)
+    def _register_multiscale(self, template_path) -> List[str]:
+        """把模板的所有尺度注册到 fft_matcher，返回各尺度的名字"""
+        names = [f"{template_path}@{scale:.3f}" for scale in Config.MULTISCALE_SCALES]
+        with _fft_matcher_lock:
+            if self.fft_matcher.has(names[0]):
+                return names
+            tpl = cv2.imread(template_path)
+            gray_tpl = cv2.cvtColor(tpl, cv2.COLOR_BGR2GRAY)
+            tH, tW = gray_tpl.shape[:2]
+            for name, scale in zip(names, Config.MULTISCALE_SCALES):
+                resized = cv2.resize(gray_tpl, (int(tW * scale), int(tH * scale)))
+                self.fft_matcher.register(name, resized)
+        return names
+
+    def multiscale_match_all(self, screen, template_paths, cancel_event=None) -> dict:
+        """
+        同一帧上匹配多个模板的所有尺度，较大的尺度共用一次 FFT (见 SharedFFTMatcher)。
+        返回 {template_path: 匹配结果或 None}；cancel_event 被置位时抛出 MatchCancelled
+        """
         gray_screen = cv2.cvtColor(screen, cv2.COLOR_BGR2GRAY)
-        gray_tpl = cv2.cvtColor(tpl, cv2.COLOR_BGR2GRAY)
-        tH, tW = gray_tpl.shape[:2]
-        best = None
-        for scale in np.linspace(0.5, 2.0, 15):
-            resized = cv2.resize(gray_tpl, (int(tW * scale), int(tH * scale)))
-            if gray_screen.shape[0] < resized.shape[0] or gray_screen.shape[1] < resized.shape[1]: continue
-            res = cv2.matchTemplate(gray_screen, resized, cv2.TM_CCOEFF_NORMED)
-            _, max_val, _, max_loc = cv2.minMaxLoc(res)
-            if max_val > (best[0] if best else 0.65):
-                best = (max_val, max_loc, resized.shape[:2])
-        if best:
-            v, loc, (h, w) = best
-            # [关键修复] 这里的返回也强制转 int
-            return {"pos": (int(loc[0]+w//2), int(loc[1]+h//2)), 
-                    "rect": (int(loc[0]), int(loc[1]), int(loc[0]+w), int(loc[1]+h)), 
-                    "conf": v}
-        return None
+        names_by_path = {path: self._register_multiscale(path)
+                         for path in template_paths if os.path.exists(path)}
+        all_names = [name for names in names_by_path.values() for name in names]
+        res_maps = self.fft_matcher.match(gray_screen, all_names, cancel_event=cancel_event) if all_names else {}
+
+        results = {path: None for path in template_paths}
+        for path, names in names_by_path.items():
+            best = None
+            for name in names:
+                res = res_maps.get(name)
+                if res is None: continue
+                _, max_val, _, max_loc = cv2.minMaxLoc(res)
+                if max_val > (best[0] if best else Config.MULTISCALE_MIN_CONF):
+                    best = (max_val, max_loc, self.fft_matcher.template_shape(name))
+            if best:
+                v, loc, (h, w) = best
+                # [关键修复] 这里的返回也强制转 int
+                results[path] = {"pos": (int(loc[0]+w//2), int(loc[1]+h//2)), 
+                                 "rect": (int(loc[0]), int(loc[1]), int(loc[0]+w), int(loc[1]+h)), 
+                                 "conf": float(v)}
+        return results
 
-    def call_sift_server(self, screen, tpl_key):
+    def multiscale_match(self, screen, template_path, cancel_event=None):
+        return self.multiscale_match_all(screen, [template_path], cancel_event=cancel_event)[template_path]
+
+    def call_sift_server(self, screen, tpl_key, cancel_event=None):
         try:
             tpl_path = Config.SEEDS[tpl_key]
             if not os.path.exists(tpl_path): return None
             _, img_enc = cv2.imencode('.jpg', screen)
+            # 已发出的 HTTP 请求无法中止，只能在发出前放弃；发出之后的 None 是真正的未命中
+            if cancel_event is not None and cancel_event.is_set(): raise MatchCancelled()
             with open(tpl_path, 'rb') as f:
                 files = {'target': ('t.jpg', img_enc.tobytes(), 'image/jpeg'),
                          'template': ('p.jpg', f.read(), 'image/jpeg')}
-                resp = self.session.post(Config.SERVER_URL, data={'mode': 'sift'}, files=files, timeout=5)
-                if resp.status_code == 200 and resp.json().get('success'):
+                if Config.SIFT_RECORD_DIR:
+                    self.save_sift_pair(files, tpl_path)
+                resp = self.server_pool.post(data={'mode': 'sift'}, files=files)
+                if resp is not None and resp.status_code == 200 and resp.json().get('success'):
                     # [关键修复] 确保服务端返回的数据也被转为 int
                     data = resp.json()['data']
                     data['pos'] = [int(p) for p in data['pos']]
                     data['rect'] = [int(p) for p in data['rect']]
                     return data
+        except MatchCancelled:
+            raise
         except Exception as e:
-            logger.error(f"[{self.adb_manager.device_id}] CV服务器调用失败: {e}")
+            self.log.error("[%s] CV服务器调用失败: %s", self.adb_manager.device_id, e)
         return None
 
+    def save_sift_pair(self, files, tpl_path):
+        """保存一组 target/template，文件名格式与 load_test.py 的 --pairs 一致"""
+        os.makedirs(Config.SIFT_RECORD_DIR, exist_ok=True)
+        device = str(self.adb_manager.device_id).replace(":", "_")
+        name = os.path.join(Config.SIFT_RECORD_DIR, f"{device}_{int(time.time() * 1000)}")
+        with open(f"{name}_target.jpg", 'wb') as f:
+            f.write(files['target'][1])
+        with open(f"{name}_template{os.path.splitext(tpl_path)[1]}", 'wb') as f:
+            f.write(files['template'][1])
+
     def wait_for_ui_change(self, roi_rect, original_img, timeout=1.5):
         x1, y1, x2, y2 = roi_rect
         original_roi = cv2.cvtColor(original_img[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
@@ -290,16 +671,189 @@ class VisualServo:
             diff = np.mean(cv2.absdiff(original_roi, current_roi))
             max_diff = max(max_diff, diff)
             if diff > Config.UI_CHANGE_DIFF: 
-                logger.info(f"⚡ [{self.adb_manager.device_id}] UI闭环检测通过 (Diff: {diff:.1f})")
+                self.log.info("⚡ [%s] UI闭环检测通过 (Diff: %.1f)", self.adb_manager.device_id, diff, extra=SAMPLED)
                 return True
             time.sleep(Config.POLL_INTERVAL)
-        logger.debug(f"⚠️ [{self.adb_manager.device_id}] UI闭环超时 (最大Diff: {max_diff:.1f})")
+        self.log.debug("⚠️ [%s] UI闭环超时 (最大Diff: %.1f)", self.adb_manager.device_id, max_diff, extra=SAMPLED)
         return False
 
-# ================= 4. 中央控制器 =================
+# ================= 6. 本地/服务器对冲匹配 =================
+class MatcherStats:
+    """
+    单个 (模板, 匹配器) 的调用统计 (指数滑动平均)。
+    被对手抢先而中途取消的调用是删失样本：真实耗时至少为已用时间，命中与否未知。
+    """
+    def __init__(self, alpha: float = Config.HEDGE_STATS_ALPHA):
+        self.alpha = alpha
+        self.calls = 0       # 跑完的调用数 (命中率只由它们更新)
+        self.samples = 0     # 含删失样本的总数 (耗时由它们更新)
+        self.latency = 0.0
+        self.hit_rate = 0.0
+
+    def update(self, latency: float, hit: bool, censored: bool = False):
+        if censored and self.samples:
+            latency = max(latency, self.latency)
+        if self.samples == 0:
+            self.latency = latency
+        else:
+            self.latency += self.alpha * (latency - self.latency)
+        self.samples += 1
+        if censored:
+            return
+        if self.calls == 0:
+            self.hit_rate = float(hit)
+        else:
+            self.hit_rate += self.alpha * (float(hit) - self.hit_rate)
+        self.calls += 1
+
+    def expected_cost(self) -> Optional[float]:
+        """得到一次命中的期望耗时，越小越应该先跑；无样本时返回 None，只有删失样本时按必中估计"""
+        if self.samples == 0:
+            return None
+        hit_rate = self.hit_rate if self.calls else 1.0
+        return self.latency / max(hit_rate, 0.05)
+
+
+_match_executors = {}
+_match_executor_lock = threading.Lock()
+
+def get_match_executor(matcher: str) -> ThreadPoolExecutor:
+    """
+    进程内所有设备共享的匹配线程池，本地和服务器各一个：
+    输掉的服务器请求无法中止，会占着线程直到超时，不能让它们挡住后面的本地匹配
+    """
+    with _match_executor_lock:
+        if matcher not in _match_executors:
+            workers = Config.HEDGE_LOCAL_WORKERS if matcher == "local" else Config.HEDGE_SERVER_WORKERS
+            _match_executors[matcher] = ThreadPoolExecutor(max_workers=workers,
+                                                           thread_name_prefix=f"Match-{matcher}")
+        return _match_executors[matcher]
+
+
+class HedgedMatchStrategy:
+    """
+    本地多尺度匹配与 CV 服务器 SIFT 匹配的对冲策略：
+    - 按每个模板的历史耗时/命中率决定谁先跑
+    - 先跑的一方超过延迟预算或未命中时启动另一方 (HEDGE_PARALLEL=True 时两者同时开跑)
+    - 取第一个确定的结果，并取消另一方
+    """
+    MATCHERS = ("local", "server")
+
+    def __init__(self, servo: VisualServo, executors: Optional[dict] = None,
+                 parallel: bool = Config.HEDGE_PARALLEL,
+                 latency_budget: float = Config.HEDGE_LATENCY_BUDGET,
+                 confident_conf: float = Config.HEDGE_CONFIDENT_CONF,
+                 explore_rate: float = Config.HEDGE_EXPLORE_RATE):
+        self.servo = servo
+        self.executors = executors or {m: get_match_executor(m) for m in self.MATCHERS}
+        self.parallel = parallel
+        self.latency_budget = latency_budget
+        self.confident_conf = confident_conf
+        self.explore_rate = explore_rate
+        self.stats = {}   # (tpl_key, matcher) -> MatcherStats
+        self._lock = threading.Lock()
+
+    def _stats(self, tpl_key: str, matcher: str) -> MatcherStats:
+        with self._lock:
+            return self.stats.setdefault((tpl_key, matcher), MatcherStats())
+
+    def order(self, tpl_key: str) -> List[str]:
+        """
+        期望耗时小的优先。只有一方有统计时，它的期望耗时在延迟预算内就让它先跑
+        (否则反正要等到预算耗尽才启动另一方)；两边都没有统计时本地优先。
+        偶尔 (explore_rate) 反过来让另一方先跑：先跑的一方一直命中时另一方永远不会启动，
+        它的统计就停在过去，环境变好了也没机会翻身。
+        """
+        costs = {m: self._stats(tpl_key, m).expected_cost() for m in self.MATCHERS}
+        known = [m for m in self.MATCHERS if costs[m] is not None]
+        if len(known) == 2:
+            ranked = sorted(self.MATCHERS, key=lambda m: costs[m])
+        elif len(known) == 1 and costs[known[0]] <= self.latency_budget:
+            ranked = known + [m for m in self.MATCHERS if m not in known]
+        elif len(known) == 1:
+            ranked = [m for m in self.MATCHERS if m not in known] + known
+        else:
+            ranked = list(self.MATCHERS)
+        if random.random() < self.explore_rate:
+            ranked.reverse()
+        return ranked
+
+    def _run(self, matcher: str, screen, tpl_key: str, cancel_event: threading.Event):
+        if cancel_event.is_set():
+            # 还没开始就已经输了，没有任何信息
+            return None
+        t0 = time.time()
+        censored = False
+        try:
+            if matcher == "local":
+                result = self.servo.multiscale_match(screen, Config.SEEDS[tpl_key], cancel_event=cancel_event)
+            else:
+                result = self.servo.call_sift_server(screen, tpl_key, cancel_event=cancel_event)
+        except MatchCancelled:
+            result, censored = None, True
+        except Exception as e:
+            self.servo.log.error("[%s] %s 匹配异常: %s", self.servo.adb_manager.device_id, matcher, e)
+            result = None
+        with self._lock:
+            self.stats[(tpl_key, matcher)].update(time.time() - t0, result is not None, censored=censored)
+        return result
+
+    def _is_confident(self, matcher: str, result) -> bool:
+        if result is None:
+            return False
+        return matcher == "server" or result.get("conf", 1.0) >= self.confident_conf
+
+    def match(self, screen, tpl_key: str):
+        primary, secondary = self.order(tpl_key)
+        for m in (primary, secondary):
+            self._stats(tpl_key, m)
+        cancel_events = {m: threading.Event() for m in self.MATCHERS}
+        futures = {}
+
+        def start(matcher):
+            fut = self.executors[matcher].submit(self._run, matcher, screen, tpl_key, cancel_events[matcher])
+            futures[fut] = matcher
+
+        start(primary)
+        secondary_started = self.parallel
+        if self.parallel:
+            start(secondary)
+
+        t0 = time.time()
+        fallback = None
+        while futures:
+            timeout = None if secondary_started else max(0.0, self.latency_budget - (time.time() - t0))
+            done, _ = wait(list(futures), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                self.servo.log.debug("⏱ [%s] %s 匹配超出预算，启动 %s 对冲", self.servo.adb_manager.device_id, primary, secondary)
+                start(secondary)
+                secondary_started = True
+                continue
+
+            for fut in done:
+                matcher = futures.pop(fut)
+                result = fut.result()
+                if self._is_confident(matcher, result):
+                    for loser_fut, loser in futures.items():
+                        cancel_events[loser].set()
+                        loser_fut.cancel()
+                    self.servo.log.debug("🏁 [%s] %s 由 %s 匹配命中 (%.0fms)", self.servo.adb_manager.device_id,
+                                         tpl_key, matcher, (time.time() - t0) * 1000)
+                    return result
+                if result is not None and fallback is None:
+                    fallback = result
+
+            if not secondary_started:
+                start(secondary)
+                secondary_started = True
+
+        return fallback
+
+# ================= 7. 中央控制器 =================
 class BotController:
     def __init__(self, device_id: str, like_limit: int):
         self.adb_manager = ADBManager(device_id)
+        self.log = self.adb_manager.log
         self.width = self.adb_manager.width
         self.height = self.adb_manager.height
         self.safe_y_limit = int(self.height * Config.BOTTOM_SAFE_LINE)
@@ -309,36 +863,62 @@ class BotController:
         self.roi_offset = int(self.height * Config.ROI_OFFSET_PCT)
         
         self.servo = VisualServo(self.adb_manager)
+        self.matcher = HedgedMatchStrategy(self.servo)
         self.runtime_assets = {}
         self.vector = None       
         self.action_count = 0
         self.like_count = 0
         self.like_limit = like_limit
         self.last_cy = None  # [新增] 记录上一个处理的 Y 位置，用于优化距离计算
+
+        self.recorder = None
+        if Config.FLIGHT_RECORDER_ENABLED:
+            safe_id = str(device_id).replace(":", "_").replace("/", "_")
+            self.recorder = FlightRecorder(os.path.join(Config.FLIGHT_RECORDER_DIR, f"{safe_id}.rec"),
+                                           slots=Config.FLIGHT_RECORDER_SLOTS,
+                                           frame_width=Config.FLIGHT_RECORDER_FRAME_WIDTH,
+                                           frame_max_height=Config.FLIGHT_RECORDER_FRAME_MAX_HEIGHT)
         
         self.servo.cluster_dist_sq = self.cluster_dist_sq
 
     def random_sleep(self, min_s, max_s):
         time.sleep(random.uniform(min_s, max_s))
 
+    def new_action_log(self) -> list:
+        """开始记录新一段 tap/swipe 动作，返回的列表随后交给 record_frame"""
+        actions = []
+        self.adb_manager.action_log = actions
+        return actions
+
+    def record_frame(self, screen, event, buttons, timings, actions, **extra):
+        """把本轮循环 (或校准/重置的一步) 交给飞行记录仪 (非阻塞)"""
+        if self.recorder is not None:
+            self.recorder.record(screen, event=event, detections=buttons, timings=timings, actions=list(actions),
+                                 like_count=self.like_count, **extra)
+
     def calibrate(self, max_retries=3):
-        logger.info(f"🛠 [{self.adb_manager.device_id}] 正在校准...")
+        self.log.info("🛠 [%s] 正在校准...", self.adb_manager.device_id)
         for attempt in range(1, max_retries + 1):
+            actions = self.new_action_log()
+            t_start = time.time()
             screen = self.servo.get_screen_cv()
+            t_screenshot = time.time()
             if screen is None:
-                logger.error(f"❌ [{self.adb_manager.device_id}] 无法获取屏幕截图 (尝试 {attempt}/{max_retries})")
+                self.log.error("❌ [%s] 无法获取屏幕截图 (尝试 %s/%s)", self.adb_manager.device_id, attempt, max_retries)
+                self.record_frame(None, "cal_dots", [], {"screenshot": t_screenshot - t_start}, actions, attempt=attempt)
                 if attempt == max_retries:
                     return False
                 self.random_sleep(1.0, 2.0)
                 continue
 
-            match = self.servo.multiscale_match(screen, Config.SEEDS["dots"])
-            if not match: match = self.servo.call_sift_server(screen, "dots")
+            match = self.matcher.match(screen, "dots")
+            timings = {"screenshot": t_screenshot - t_start, "match": time.time() - t_screenshot}
 
             if not match:
-                logger.warning(f"⚠️ [{self.adb_manager.device_id}] 未找到dots按钮 (尝试 {attempt}/{max_retries})")
+                self.record_frame(screen, "cal_dots", [], timings, actions, attempt=attempt, match=None)
+                self.log.warning("⚠️ [%s] 未找到dots按钮 (尝试 %s/%s)", self.adb_manager.device_id, attempt, max_retries)
                 if attempt == max_retries:
-                    logger.critical(f"❌ [{self.adb_manager.device_id}] 校准失败: 未找到dots按钮")
+                    self.log.critical("❌ [%s] 校准失败: 未找到dots按钮", self.adb_manager.device_id)
                     return False
                 self.random_sleep(1.0, 2.0)
                 continue
@@ -347,32 +927,39 @@ class BotController:
             self.runtime_assets["dots"] = screen[d_rect[1]:d_rect[3], d_rect[0]:d_rect[2]]
 
             self.adb_manager.touch(*d_pos)
+            self.record_frame(screen, "cal_dots", [d_pos], timings, actions, attempt=attempt, match=match)
             self.random_sleep(0.5, 1.0)  # 等待菜单弹出
+            actions = self.new_action_log()
+            t_start = time.time()
             menu_screen = self.servo.get_screen_cv()
+            t_screenshot = time.time()
 
             if menu_screen is None:
-                logger.warning(f"⚠️ [{self.adb_manager.device_id}] 无法获取菜单屏幕截图 (尝试 {attempt}/{max_retries})")
+                self.log.warning("⚠️ [%s] 无法获取菜单屏幕截图 (尝试 %s/%s)", self.adb_manager.device_id, attempt, max_retries)
+                self.record_frame(None, "cal_like", [], {"screenshot": t_screenshot - t_start}, actions, attempt=attempt)
                 if attempt == max_retries:
                     return False
                 self.random_sleep(1.0, 2.0)
                 continue
 
-            match_like = self.servo.multiscale_match(menu_screen, Config.SEEDS["like"])
-            if not match_like: match_like = self.servo.call_sift_server(menu_screen, "like")
+            match_like = self.matcher.match(menu_screen, "like")
+            timings = {"screenshot": t_screenshot - t_start, "match": time.time() - t_screenshot}
 
             if match_like:
                 l_pos, l_rect = match_like['pos'], match_like['rect']
                 self.runtime_assets["like"] = menu_screen[l_rect[1]:l_rect[3], l_rect[0]:l_rect[2]]
                 self.vector = (l_pos[0] - d_pos[0], l_pos[1] - d_pos[1])
-                logger.info(f"✅ [{self.adb_manager.device_id}] 校准成功 (Vector: {self.vector})")
+                self.log.info("✅ [%s] 校准成功 (Vector: %s)", self.adb_manager.device_id, self.vector)
                 self.adb_manager.touch(*d_pos)  # 关闭菜单
+                self.record_frame(menu_screen, "cal_like", [l_pos], timings, actions, attempt=attempt, match=match_like)
                 self.random_sleep(0.5, 0.8)
                 return True
             else:
-                logger.warning(f"⚠️ [{self.adb_manager.device_id}] 未找到like图标 (尝试 {attempt}/{max_retries})")
+                self.log.warning("⚠️ [%s] 未找到like图标 (尝试 %s/%s)", self.adb_manager.device_id, attempt, max_retries)
                 self.adb_manager.touch(*d_pos)  # 关闭菜单以重试
+                self.record_frame(menu_screen, "cal_like", [], timings, actions, attempt=attempt, match=None)
                 if attempt == max_retries:
-                    logger.critical(f"❌ [{self.adb_manager.device_id}] 校准失败: 未找到like图标")
+                    self.log.critical("❌ [%s] 校准失败: 未找到like图标", self.adb_manager.device_id)
                     return False
                 self.random_sleep(1.0, 2.0)
 
@@ -391,46 +978,55 @@ class BotController:
         return cv2.countNonZero(mask) > 15
 
     def reset_to_top(self, max_retries=5):
-        logger.info(f"🔄 [{self.adb_manager.device_id}] 点赞达到限额，重置到顶部...")
+        self.log.info("🔄 [%s] 点赞达到限额，重置到顶部...", self.adb_manager.device_id)
         top_region_height = int(self.height * 0.2)
-        template_path = Config.SEEDS["pengyouquan"]  # 假设模板文件存在
 
         for attempt in range(1, max_retries + 1):
+            actions = self.new_action_log()
+            t_start = time.time()
             screen = self.servo.get_screen_cv()
+            t_screenshot = time.time()
             if screen is None:
+                self.record_frame(None, "reset_top", [], {"screenshot": t_screenshot - t_start}, actions, attempt=attempt)
                 self.random_sleep(1.0, 2.0)
                 continue
 
             # 只截取顶部20%区域
             top_screen = screen[0:top_region_height, :]
 
-            match = self.servo.multiscale_match(top_screen, template_path)
-            if not match: match = self.servo.call_sift_server(top_screen, "pengyouquan")
+            match = self.matcher.match(top_screen, "pengyouquan")
+            timings = {"screenshot": t_screenshot - t_start, "match": time.time() - t_screenshot}
 
             if match:
-                logger.info(f"✅ [{self.adb_manager.device_id}] 已到顶部 (找到朋友圈标题)")
+                self.log.info("✅ [%s] 已到顶部 (找到朋友圈标题)", self.adb_manager.device_id)
+                self.record_frame(screen, "reset_top", [match['pos']], timings, actions, attempt=attempt, match=match)
                 self.random_sleep(0.5, 1.0)
                 return True
 
             # 未找到，向上滑动 (从下往上滑)
-            logger.warning(f"⚠️ [{self.adb_manager.device_id}] 未到顶部，向上滑动 (尝试 {attempt}/{max_retries})")
+            self.log.warning("⚠️ [%s] 未到顶部，向上滑动 (尝试 %s/%s)", self.adb_manager.device_id, attempt, max_retries)
             center_x = self.width // 2
             start_y = int(self.height * 0.7)  # 从下部开始
             end_y = int(self.height * 0.3)    # 向上滑到上部
             self.adb_manager.swipe(center_x, start_y, center_x, end_y, duration=0.6)
+            self.record_frame(screen, "reset_top", [], timings, actions, attempt=attempt, match=None)
             self.random_sleep(0.8, 1.2)
 
-        logger.critical(f"❌ [{self.adb_manager.device_id}] 重置到顶部失败")
+        self.log.critical("❌ [%s] 重置到顶部失败", self.adb_manager.device_id)
         return False
 
     def execute_pipeline(self):
         if not self.calibrate(): return
-        logger.info(f"🚀 [{self.adb_manager.device_id}] 多目标优先流水线启动 (限额: {self.like_limit})")
+        self.log.info("🚀 [%s] 多目标优先流水线启动 (限额: %s)", self.adb_manager.device_id, self.like_limit)
         
         while True:
+            actions = self.new_action_log()
+            t_start = time.time()
             screen = self.servo.get_screen_cv()
+            t_screenshot = time.time()
             if screen is None:
-                logger.error(f"❌ [{self.adb_manager.device_id}] 无法获取屏幕截图，重试中...")
+                self.log.error("❌ [%s] 无法获取屏幕截图，重试中...", self.adb_manager.device_id)
+                self.record_frame(None, "no_screen", [], {"screenshot": t_screenshot - t_start}, actions)
                 self.random_sleep(1.0, 1.5)
                 continue
             
@@ -439,39 +1035,49 @@ class BotController:
             
             # 过滤掉顶部死区内的
             valid_buttons = [b for b in all_buttons if b[1] > self.top_dead_zone]
+            t_detect = time.time()
+            timings = {"screenshot": t_screenshot - t_start, "detect": t_detect - t_screenshot}
             
             if valid_buttons:
                 # 永远取 Top 1
                 dot_pos = valid_buttons[0] 
                 cy = dot_pos[1]
                 
-                logger.info(f"🎯 [{self.adb_manager.device_id}] 锁定顶部目标 @ Y={cy}")
+                self.log.info("🎯 [%s] 锁定顶部目标 @ Y=%s", self.adb_manager.device_id, cy, extra=SAMPLED)
 
                 if cy > self.safe_y_limit:
-                    logger.warning(f"⚠️ [{self.adb_manager.device_id}] 目标触底，大幅回正")
+                    self.log.warning("⚠️ [%s] 目标触底，大幅回正", self.adb_manager.device_id)
                     self.adaptive_swipe(pixel_distance=int(self.height * 0.4))
                     self.last_cy = None  # 重置记录
+                    timings["swipe"] = time.time() - t_detect
+                    self.record_frame(screen, "bottom", valid_buttons, timings, actions)
                     continue
 
                 self.process_target(dot_pos, screen)
+                t_process = time.time()
+                timings["process"] = t_process - t_detect
                 
                 # [优化] 自适应滑动：基于当前处理的 cy 和下一个按钮的距离计算（实现一次处理一条）
                 if len(valid_buttons) > 1:
                     next_cy = valid_buttons[1][1]
                     calc_dist = max(0, next_cy - cy) + self.swipe_buffer_px  # 按钮间实际距离 + 缓冲
-                    logger.info(f"📐 [{self.adb_manager.device_id}] 实时计算滑动距离: {calc_dist} (基于当前Y={cy} 和下一个Y={next_cy})")
+                    self.log.info("📐 [%s] 实时计算滑动距离: %s (基于当前Y=%s 和下一个Y=%s)", self.adb_manager.device_id, calc_dist, cy, next_cy, extra=SAMPLED)
                 else:
                     calc_dist = int(self.height * 0.25)  # 默认减小以加快
-                    logger.info(f"📐 [{self.adb_manager.device_id}] 无下一个按钮，使用默认滑动距离: {calc_dist}")
+                    self.log.info("📐 [%s] 无下一个按钮，使用默认滑动距离: %s", self.adb_manager.device_id, calc_dist, extra=SAMPLED)
                 
                 self.adaptive_swipe(pixel_distance=calc_dist)
                 self.last_cy = cy  # 更新记录（备用，如果下次无下一个可用）
+                timings["swipe"] = time.time() - t_process
+                self.record_frame(screen, "target", valid_buttons, timings, actions)
                 
             else:
-                logger.info(f"🔍 [{self.adb_manager.device_id}] 无有效目标，补进扫描...")
+                self.log.info("🔍 [%s] 无有效目标，补进扫描...", self.adb_manager.device_id, extra=SAMPLED)
                 calc_dist = int(self.height * 0.25)  # 默认减小
                 self.adaptive_swipe(pixel_distance=calc_dist)
                 self.last_cy = None
+                timings["swipe"] = time.time() - t_detect
+                self.record_frame(screen, "scan", valid_buttons, timings, actions)
                 self.random_sleep(0.6, 0.9)  # 减小睡眠时间，加快速度
             
             if self.like_count >= self.like_limit:
@@ -479,18 +1085,20 @@ class BotController:
                     self.like_count = 0
                     self.calibrate()  # 重新校准
                 else:
-                    logger.error(f"❌ [{self.adb_manager.device_id}] 重置失败，暂停...")
+                    self.log.error("❌ [%s] 重置失败，暂停...", self.adb_manager.device_id)
                     time.sleep(60)  # 暂停一分钟重试
 
             if self.action_count >= Config.BURST_LIMIT:
-                logger.info(f"💤 [{self.adb_manager.device_id}] 冷却休息...")
-                time.sleep(random.randint(40, 70))
+                self.log.info("💤 [%s] 冷却休息...", self.adb_manager.device_id)
+                cooldown = random.randint(40, 70)
+                self.record_frame(None, "cooldown", [], {}, [], action_count=self.action_count, seconds=cooldown)
+                time.sleep(cooldown)
                 self.action_count = 0
                 self.calibrate() 
 
     def process_target(self, dot_pos, current_screen):
         if random.random() < Config.SKIP_PROBABILITY:
-            logger.info(f"🎲 [{self.adb_manager.device_id}] 随机跳过")
+            self.log.info("🎲 [%s] 随机跳过", self.adb_manager.device_id)
             return
 
         # 点击目标位置
@@ -502,18 +1110,18 @@ class BotController:
         menu_screen = self.servo.get_screen_cv()
         
         if menu_screen is None:
-            logger.error(f"❌ [{self.adb_manager.device_id}] 无法获取菜单屏幕截图，跳过处理")
+            self.log.error("❌ [%s] 无法获取菜单屏幕截图，跳过处理", self.adb_manager.device_id)
             return
         
         if self.check_liked_status(menu_screen, dot_pos):
-            logger.info(f"💖 [{self.adb_manager.device_id}] [状态] 已赞")
+            self.log.info("💖 [%s] [状态] 已赞", self.adb_manager.device_id)
             return 
         else:
             # 计算点赞位置
             tx = int(dot_pos[0] + self.vector[0] + random.randint(-2, 2))
             ty = int(dot_pos[1] + self.vector[1] + random.randint(-2, 2))
             
-            logger.info(f"🔥 [{self.adb_manager.device_id}] [动作] 点赞")
+            self.log.info("🔥 [%s] [动作] 点赞", self.adb_manager.device_id)
             watch_rect = (int(tx - self.roi_offset), int(ty - self.roi_offset * 1.33), int(dot_pos[0] + self.roi_offset), int(dot_pos[1] + self.roi_offset * 1.33))  # 调整为动态
             self.adb_manager.touch(tx, ty)
             self.action_count += 1
@@ -542,24 +1150,44 @@ class BotController:
         self.random_sleep(0.1, 0.2)  # 微小延迟等滑动完成，减小时间
         stop_touch_x = center_x + random.randint(-int(self.width * 0.05), int(self.width * 0.05))  # 中央偏随机
         stop_touch_y = max(end_y, int(self.height * 0.4)) + random.randint(-int(self.height * 0.02), int(self.height * 0.02))  # 确保在中部以上，避免底部导航
-        logger.debug(f"🛑 [{self.adb_manager.device_id}] 停止漂移: 轻触 @ ({stop_touch_x}, {stop_touch_y})")
+        self.log.debug("🛑 [%s] 停止漂移: 轻触 @ (%s, %s)", self.adb_manager.device_id, stop_touch_x, stop_touch_y, extra=SAMPLED)
         self.adb_manager.touch(stop_touch_x, stop_touch_y)
         
         self.random_sleep(0.4, 0.7)  # 整体减小睡眠，加快循环
 
-# ================= 5. CV 服务管理 =================
-def manage_cv_server():
+# ================= 8. CV 服务管理 =================
+def local_server_ports() -> List[int]:
+    """从 Config.SERVER_URLS 中找出指向本机的端口"""
+    ports = []
+    for url in Config.SERVER_URLS:
+        parts = urlsplit(url)
+        if parts.hostname in ("localhost", "127.0.0.1", "0.0.0.0"):
+            port = parts.port or 80
+            if port not in ports:
+                ports.append(port)
+    return ports
+
+def manage_cv_server() -> List[Process]:
+    flush_logs()
     use_local = input("\n是否自动启动本地 CV 服务器? (y/n): ").strip().lower() == 'y'
     
     if not use_local:
-        return None
+        return []
 
-    logger.info("🚀 使用独立进程启动本地 CV 服务器...")
-    p = Process(target=run_server, daemon=True)
-    p.start()
-    # 移除 time.sleep(0.5) 以避免阻塞
-    logger.info(f"✅ CV 服务器进程启动 (PID: {p.pid})")
-    return p
+    ports = local_server_ports()
+    if not ports:
+        logger.warning("⚠️ SERVER_URLS 中没有本地地址，不启动本地 CV 服务器")
+        return []
+
+    processes = []
+    for port in ports:
+        logger.info(f"🚀 使用独立进程启动本地 CV 服务器 (端口: {port})...")
+        p = Process(target=run_server, args=(port,), daemon=True)
+        p.start()
+        # 移除 time.sleep(0.5) 以避免阻塞
+        logger.info(f"✅ CV 服务器进程启动 (PID: {p.pid}, 端口: {port})")
+        processes.append(p)
+    return processes
 
 def select_and_configure_devices() -> List[Tuple[str, bool, int]]:
     """
@@ -575,6 +1203,7 @@ def select_and_configure_devices() -> List[Tuple[str, bool, int]]:
         logger.info(f"   [{i}] {dev}")
 
     selected_ids = []
+    flush_logs()
     choice = input("\n请选择要连接的设备编号 (逗号分隔, e.g. 1,3 或 all): ").strip()
     if choice.lower() == 'all':
         selected_ids = devices
@@ -593,6 +1222,7 @@ def select_and_configure_devices() -> List[Tuple[str, bool, int]]:
     configured = []
     logger.info("\n接下来为每个设备选择运行模式：")
     for dev_id in selected_ids:
+        flush_logs()
         run_bot = input(f"设备 {dev_id} 是否运行完整点赞自动化？(y/n): ").strip().lower() == 'y'
         like_limit = Config.LIKE_LIMIT_DEFAULT
         if run_bot:
@@ -605,13 +1235,13 @@ def select_and_configure_devices() -> List[Tuple[str, bool, int]]:
     return configured
 
 if __name__ == "__main__":
-    server_process = None
+    server_processes = []
     selected_devices = []           # ← 在 try 外提前声明为空列表
     configured_devices = []         # 如果你用了 configured_devices，也提前声明
 
     try:
         # 1. 统一处理 CV 服务器
-        server_process = manage_cv_server()
+        server_processes = manage_cv_server()
 
         # 2. 选择并配置设备
         configured_devices = select_and_configure_devices()
@@ -635,13 +1265,13 @@ if __name__ == "__main__":
                 )
             else:
                 # 监控模式...
-                def monitor_only():
-                    logger.info(f"[{device_id}] 监控模式启动，仅截图不操作")
+                def monitor_only(bot=bot, device_id=device_id):
+                    bot.log.info("[%s] 监控模式启动，仅截图不操作", device_id)
                     while True:
                         img = bot.servo.get_screen_cv()
                         if img is None:
                             continue
-                        logger.debug(f"[{device_id}] 截图成功 {img.shape}")
+                        bot.log.debug("[%s] 截图成功 %s", device_id, img.shape)
                         time.sleep(5)
                 t = threading.Thread(target=monitor_only, name=f"Monitor-{device_id}", daemon=True)
 
@@ -675,10 +1305,11 @@ if __name__ == "__main__":
                 pass
         
         # 关闭 CV 服务器
-        if server_process and server_process.is_alive():
-            try:
-                server_process.terminate()
-                server_process.join(timeout=3)
-            except:
-                server_process.kill()
-            logger.info("本地 CV 服务器已终止")
\ No newline at end of file
+        for server_process in server_processes:
+            if server_process.is_alive():
+                try:
+                    server_process.terminate()
+                    server_process.join(timeout=3)
+                except:
+                    server_process.kill()
+                logger.info(f"本地 CV 服务器已终止 (PID: {server_process.pid})")
\ No newline at end of file
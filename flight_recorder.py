@@ -0,0 +1,216 @@
+# -*- encoding=utf8 -*-
+# flight_recorder.py - 飞行记录仪 (基于内存映射文件的每设备环形缓冲区)
+#
+# 记录最近 N 帧的缩略图 + 检测结果 + 阶段耗时 + 执行的动作，
+# 由后台线程写入，流水线线程只做一次非阻塞入队。
+# 进程崩溃或设备卡死后，用下面的命令导出为图片和时间线：
+#   python flight_recorder.py flight_records/<device>.rec -o dump_dir
+import os
+import cv2
+import json
+import mmap
+import time
+import queue
+import struct
+import logging
+import argparse
+import threading
+import numpy as np
+from typing import List, Optional
+
+logger = logging.getLogger("Bot")
+
+MAGIC = b"FLTREC01"
+# 文件头: magic, 槽位数, 每槽帧字节数, 每槽元数据字节数, 已写入记录总数
+FILE_HEADER = struct.Struct("<8sIIIQ")
+FILE_HEADER_SIZE = 64
+# 槽位头: 序号 (0 表示空/写入中), 时间戳, 帧高, 帧宽, 元数据长度
+SLOT_HEADER = struct.Struct("<QdIII")
+SLOT_HEADER_SIZE = 32
+
+
+class FlightRecorder:
+    """
+    每设备一个的环形缓冲区，数据放在内存映射文件里：
+    进程退出/崩溃后文件内容仍在，可事后分析。
+    """
+    def __init__(self, path: str, slots: int = 64, frame_width: int = 270,
+                 frame_max_height: int = 640, meta_bytes: int = 4096, queue_size: int = 8):
+        self.path = path
+        self.slots = slots
+        self.frame_width = frame_width
+        self.frame_max_height = frame_max_height
+        self.frame_bytes = frame_width * frame_max_height * 3
+        self.meta_bytes = meta_bytes
+        self.slot_size = SLOT_HEADER_SIZE + self.frame_bytes + meta_bytes
+        self.seq = 0
+        self.dropped = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if os.path.exists(path):
+            # 保留上一次运行的记录，避免重启后现场被覆盖
+            os.replace(path, os.path.splitext(path)[0] + ".prev.rec")
+        total_size = FILE_HEADER_SIZE + self.slots * self.slot_size
+        with open(path, "wb") as f:
+            f.truncate(total_size)
+        self._file = open(path, "r+b")
+        self._mm = mmap.mmap(self._file.fileno(), total_size)
+        self._write_file_header()
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._closed = False
+        self._thread = threading.Thread(target=self._writer_loop, name=f"FlightRecorder-{os.path.basename(path)}",
+                                        daemon=True)
+        self._thread.start()
+
+    def _write_file_header(self):
+        self._mm[:FILE_HEADER.size] = FILE_HEADER.pack(MAGIC, self.slots, self.frame_bytes, self.meta_bytes, self.seq)
+
+    def record(self, frame: Optional[np.ndarray], **meta):
+        """
+        非阻塞记录一帧。frame 可以为 None (只记录事件)；
+        meta 中放检测结果、阶段耗时、动作等可 JSON 序列化的数据。
+        队列满时直接丢弃，绝不阻塞调用方。
+        """
+        if self._closed:
+            return
+        meta.setdefault("ts", time.time())
+        try:
+            self._queue.put_nowait((frame, meta))
+        except queue.Full:
+            self.dropped += 1
+
+    def _writer_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                self._write_slot(*item)
+            except Exception as e:
+                logger.error(f"飞行记录写入失败 ({self.path}): {e}")
+
+    def _write_slot(self, frame: Optional[np.ndarray], meta: dict):
+        thumb = None
+        if frame is not None:
+            h, w = frame.shape[:2]
+            scale = min(self.frame_width / w, self.frame_max_height / h)
+            thumb = cv2.resize(frame, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+            if thumb.ndim == 2:
+                thumb = cv2.cvtColor(thumb, cv2.COLOR_GRAY2BGR)
+            meta["scale"] = scale
+
+        meta["dropped"] = self.dropped
+        meta_raw = json.dumps(meta, ensure_ascii=False, default=_json_default).encode("utf-8")
+        if len(meta_raw) > self.meta_bytes:
+            meta_raw = json.dumps({"ts": meta["ts"], "truncated": True}).encode("utf-8")
+
+        self.seq += 1
+        offset = FILE_HEADER_SIZE + ((self.seq - 1) % self.slots) * self.slot_size
+        # 先把序号清零，数据写完后再写序号，崩溃时不会读到半截的槽位
+        self._mm[offset:offset + 8] = struct.pack("<Q", 0)
+        th, tw = (thumb.shape[:2] if thumb is not None else (0, 0))
+        data_offset = offset + SLOT_HEADER_SIZE
+        if thumb is not None:
+            self._mm[data_offset:data_offset + thumb.nbytes] = thumb.tobytes()
+        meta_offset = data_offset + self.frame_bytes
+        self._mm[meta_offset:meta_offset + len(meta_raw)] = meta_raw
+        self._mm[offset:offset + SLOT_HEADER.size] = SLOT_HEADER.pack(self.seq, meta["ts"], th, tw, len(meta_raw))
+        self._write_file_header()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout=2)
+        self._mm.flush()
+        self._mm.close()
+        self._file.close()
+
+
+def _json_default(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    return str(obj)
+
+
+def read_records(path: str) -> List[dict]:
+    """读取记录文件，按序号从旧到新返回 [{seq, ts, frame, meta}, ...]"""
+    with open(path, "rb") as f:
+        raw = f.read()
+    magic, slots, frame_bytes, meta_bytes, _ = FILE_HEADER.unpack_from(raw, 0)
+    if magic != MAGIC:
+        raise ValueError(f"不是飞行记录文件: {path}")
+    slot_size = SLOT_HEADER_SIZE + frame_bytes + meta_bytes
+
+    records = []
+    for i in range(slots):
+        offset = FILE_HEADER_SIZE + i * slot_size
+        seq, ts, h, w, meta_len = SLOT_HEADER.unpack_from(raw, offset)
+        if seq == 0:
+            continue
+        data_offset = offset + SLOT_HEADER_SIZE
+        frame = None
+        if h and w:
+            frame = np.frombuffer(raw, np.uint8, h * w * 3, data_offset).reshape(h, w, 3)
+        meta_offset = data_offset + frame_bytes
+        meta = json.loads(raw[meta_offset:meta_offset + meta_len].decode("utf-8"))
+        records.append({"seq": seq, "ts": ts, "frame": frame, "meta": meta})
+    records.sort(key=lambda r: r["seq"])
+    return records
+
+
+def _annotate(frame: np.ndarray, meta: dict) -> np.ndarray:
+    """在缩略图上画出检测到的目标和动作位置"""
+    img = frame.copy()
+    scale = meta.get("scale", 1.0)
+    for x, y in meta.get("detections", []):
+        cv2.circle(img, (int(x * scale), int(y * scale)), 4, (0, 255, 0), 1)
+    match = meta.get("match")
+    if match:
+        x1, y1, x2, y2 = match["rect"]
+        cv2.rectangle(img, (int(x1 * scale), int(y1 * scale)), (int(x2 * scale), int(y2 * scale)), (0, 255, 255), 1)
+    for action in meta.get("actions", []):
+        if action[0] == "tap":
+            cv2.drawMarker(img, (int(action[1] * scale), int(action[2] * scale)), (0, 0, 255),
+                           cv2.MARKER_CROSS, 8, 1)
+        elif action[0] == "swipe":
+            cv2.arrowedLine(img, (int(action[1] * scale), int(action[2] * scale)),
+                            (int(action[3] * scale), int(action[4] * scale)), (255, 0, 0), 1)
+    return img
+
+
+def dump(path: str, out_dir: str):
+    """导出为标注后的图片 + timeline.txt + timeline.jsonl"""
+    records = read_records(path)
+    os.makedirs(out_dir, exist_ok=True)
+    if not records:
+        print(f"{path} 中没有记录")
+        return
+
+    t_first = records[0]["ts"]
+    with open(os.path.join(out_dir, "timeline.txt"), "w", encoding="utf-8") as txt, \
+            open(os.path.join(out_dir, "timeline.jsonl"), "w", encoding="utf-8") as jsonl:
+        for r in records:
+            meta = r["meta"]
+            image_name = ""
+            if r["frame"] is not None:
+                image_name = f"{r['seq']:08d}.png"
+                cv2.imwrite(os.path.join(out_dir, image_name), _annotate(r["frame"], meta))
+            timings = " ".join(f"{k}={v * 1000:.0f}ms" for k, v in meta.get("timings", {}).items())
+            actions = " ".join(a[0] for a in meta.get("actions", []))
+            txt.write(f"+{r['ts'] - t_first:8.3f}s #{r['seq']:<6} {meta.get('event', ''):<10} "
+                      f"targets={len(meta.get('detections', []))} {timings} [{actions}] {image_name}\n")
+            jsonl.write(json.dumps({"seq": r["seq"], "image": image_name, **meta}, ensure_ascii=False) + "\n")
+    print(f"已导出 {len(records)} 条记录到 {out_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="导出飞行记录为图片和时间线")
+    parser.add_argument("path", help="记录文件，如 flight_records/<device>.rec")
+    parser.add_argument("-o", "--out", default=None, help="输出目录 (默认: <记录文件名>_dump)")
+    args = parser.parse_args()
+    dump(args.path, args.out or os.path.splitext(args.path)[0] + "_dump")
@@ -0,0 +1,391 @@
+# -*- encoding=utf8 -*-
+# load_test.py - 视觉服务器压测工具
+#
+# 自动在本机启动 wechat_like_cv_server，回放 target/template 图片对到 /vision/process，
+# 统计吞吐量、p50/p95/p99 延迟、错误率、服务器 CPU，并保存为 JSON 便于前后对比。
+#
+#   python load_test.py --concurrency 8 --duration 30 --label baseline
+#   python load_test.py --rate 20 --duration 30 --workers 4 --label 4workers
+#   python load_test.py --compare
+#
+# 图片对目录 (--pairs) 中每组文件命名为 <name>_target.jpg + <name>_template.png (或 .jpg)，
+# 可以在 client.py 里设置 Config.SIFT_RECORD_DIR 从真实运行中录制；
+# 不指定时用种子模板合成目标图。
+import os
+import cv2
+import glob
+import json
+import time
+import random
+import socket
+import sys
+import logging
+import argparse
+import platform
+import threading
+import subprocess
+import numpy as np
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import List, Tuple, Optional
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - [LOADTEST] - %(levelname)s - %(message)s')
+logger = logging.getLogger("LoadTest")
+
+SEED_TEMPLATES = ["two_dots_orig.png", "like_hollow_orig.png", "pengyouquan.png"]
+RESULTS_DIR = "loadtest_results"
+
+
+# ================= 1. 测试数据 =================
+def load_pairs(pairs_dir: str) -> List[Tuple[str, bytes, bytes]]:
+    """读取录制的图片对，返回 [(name, target_jpg, template_bytes), ...]"""
+    pairs = []
+    for target_path in sorted(glob.glob(os.path.join(pairs_dir, "*_target.jpg"))):
+        name = os.path.basename(target_path)[:-len("_target.jpg")]
+        candidates = glob.glob(os.path.join(pairs_dir, f"{name}_template.*"))
+        if not candidates:
+            logger.warning(f"⚠️ 缺少模板: {name}")
+            continue
+        with open(target_path, "rb") as f:
+            target = f.read()
+        with open(candidates[0], "rb") as f:
+            template = f.read()
+        pairs.append((name, target, template))
+    return pairs
+
+
+def synthesize_pairs(count: int = 6, size: Tuple[int, int] = (1080, 2400), seed: int = 0) -> List[Tuple[str, bytes, bytes]]:
+    """没有录制数据时，把种子模板随机贴到带纹理的画布上生成目标图"""
+    rng = np.random.default_rng(seed)
+    pairs = []
+    templates = [p for p in SEED_TEMPLATES if os.path.exists(p)]
+    if not templates:
+        raise FileNotFoundError("找不到种子模板，请在仓库根目录运行或使用 --pairs")
+    w, h = size
+    for i in range(count):
+        tpl_path = templates[i % len(templates)]
+        tpl = cv2.imread(tpl_path)
+        canvas = (rng.random((h, w, 3)) * 60 + 180).astype(np.uint8)
+        canvas = cv2.GaussianBlur(canvas, (5, 5), 0)
+        th, tw = tpl.shape[:2]
+        for _ in range(3):
+            x, y = int(rng.integers(0, w - tw)), int(rng.integers(0, h - th))
+            canvas[y:y + th, x:x + tw] = tpl
+        _, target = cv2.imencode(".jpg", canvas)
+        with open(tpl_path, "rb") as f:
+            pairs.append((f"synthetic_{i}", target.tobytes(), f.read()))
+    return pairs
+
+
+# ================= 2. 服务器进程 =================
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int, workers: int, timeout: float = 30.0) -> subprocess.Popen:
+    """在本机启动视觉服务器，等待端口可连接"""
+    cmd = [sys.executable, "-m", "uvicorn", "wechat_like_cv_server:app", "--host", "127.0.0.1",
+           "--port", str(port), "--workers", str(workers), "--log-level", "warning", "--no-access-log"]
+    proc = subprocess.Popen(cmd, cwd=os.path.dirname(os.path.abspath(__file__)),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"服务器启动失败 (退出码 {proc.returncode})")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                logger.info(f"✅ 服务器已启动 (PID: {proc.pid}, 端口: {port}, workers: {workers})")
+                return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise TimeoutError("等待服务器启动超时")
+
+
+def stop_server(proc: subprocess.Popen):
+    proc.terminate()
+    try:
+        proc.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+class CpuSampler:
+    """服务器进程 (含 uvicorn worker 子进程) 累计 CPU 时间，优先用 psutil，否则读 /proc"""
+    def __init__(self, pid: int):
+        self.pid = pid
+        try:
+            import psutil
+            self._psutil = psutil
+        except ImportError:
+            self._psutil = None
+
+    def cpu_seconds(self) -> Optional[float]:
+        if self._psutil is not None:
+            try:
+                root = self._psutil.Process(self.pid)
+                total = 0.0
+                for p in [root] + root.children(recursive=True):
+                    t = p.cpu_times()
+                    total += t.user + t.system
+                return total
+            except self._psutil.Error:
+                return None
+        return self._proc_cpu_seconds()
+
+    def _proc_cpu_seconds(self) -> Optional[float]:
+        if not os.path.isdir("/proc"):
+            return None
+        ticks = os.sysconf("SC_CLK_TCK")
+        stats = {}
+        for stat_path in glob.glob("/proc/[0-9]*/stat"):
+            try:
+                with open(stat_path) as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+            except OSError:
+                continue
+            # fields[1] 为 ppid，fields[11]/[12] 为 utime/stime
+            stats[int(stat_path.split("/")[2])] = (int(fields[1]), int(fields[11]) + int(fields[12]))
+        pids, frontier = {self.pid}, [self.pid]
+        while frontier:
+            parent = frontier.pop()
+            for pid, (ppid, _) in stats.items():
+                if ppid == parent and pid not in pids:
+                    pids.add(pid)
+                    frontier.append(pid)
+        return sum(stats[pid][1] for pid in pids if pid in stats) / ticks
+
+
+# ================= 3. 压测 =================
+class LoadGenerator:
+    def __init__(self, url: str, pairs: List[Tuple[str, bytes, bytes]], timeout: float = 30.0, pool_size: int = 64):
+        self.url = url
+        self.pairs = pairs
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self._lock = threading.Lock()
+        self._inflight = set()   # 开环模式下尚未完成的请求 (以计划发送时间标识)
+        self.samples = []   # (开始时间, 延迟秒, 状态: ok/miss/error/dropped/unfinished)
+
+    def send_one(self, scheduled_at: Optional[float] = None):
+        """
+        发送一个请求。开环模式传入计划发送时间 scheduled_at，延迟从它算起 (发送端排队也计入)；
+        压测已结束 (不在 _inflight 中) 时结果不再记录。
+        """
+        name, target, template = random.choice(self.pairs)
+        files = {"target": ("t.jpg", target, "image/jpeg"), "template": ("p.png", template, "image/png")}
+        t0 = time.time() if scheduled_at is None else scheduled_at
+        try:
+            resp = self.session.post(self.url, data={"mode": "sift"}, files=files, timeout=self.timeout)
+            body = resp.json() if resp.status_code == 200 else {}
+            if resp.status_code != 200 or "error" in body:
+                status = "error"
+            else:
+                status = "ok" if body.get("success") else "miss"
+        except (requests.RequestException, ValueError):
+            status = "error"
+        with self._lock:
+            if scheduled_at is not None:
+                if scheduled_at not in self._inflight:
+                    return
+                self._inflight.discard(scheduled_at)
+            self.samples.append((t0, time.time() - t0, status))
+
+    def run_closed_loop(self, concurrency: int, duration: float, max_requests: Optional[int]):
+        """固定并发：每个虚拟设备发完一个请求立即发下一个"""
+        deadline = time.time() + duration
+        counter = iter(range(max_requests)) if max_requests else None
+
+        def worker():
+            while time.time() < deadline:
+                if counter is not None and next(counter, None) is None:
+                    return
+                self.send_one()
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def run_open_loop(self, rate: float, duration: float, max_requests: Optional[int], max_inflight: int):
+        """
+        固定到达率 (泊松到达)：不等待响应，模拟大量设备独立发请求。
+        - 延迟从计划到达时间算起，服务器变慢时发送端的排队等待也算进去 (避免协调遗漏)
+        - 未完成请求已达 max_inflight 时，新到达的请求不发送，记为 dropped
+        - 到 duration 立即结束，仍未完成的请求以已等待的时间记为 unfinished (延迟下限)
+        """
+        deadline = time.time() + duration
+        sent = 0
+        next_at = time.time()
+        executor = ThreadPoolExecutor(max_workers=max_inflight)
+        try:
+            while not max_requests or sent < max_requests:
+                next_at += random.expovariate(rate)
+                if next_at >= deadline:
+                    break
+                delay = next_at - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                sent += 1
+                with self._lock:
+                    if len(self._inflight) >= max_inflight:
+                        self.samples.append((next_at, 0.0, "dropped"))
+                        continue
+                    self._inflight.add(next_at)
+                executor.submit(self.send_one, next_at)
+
+            while time.time() < deadline:
+                with self._lock:
+                    if not self._inflight:
+                        break
+                time.sleep(0.01)
+        finally:
+            end = time.time()
+            with self._lock:
+                for scheduled_at in self._inflight:
+                    self.samples.append((scheduled_at, end - scheduled_at, "unfinished"))
+                self._inflight.clear()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def summarize(samples: List[Tuple[float, float, str]], wall: float, cpu_seconds: Optional[float]) -> dict:
+    """unfinished 请求的延迟是下限，仍计入分位数，免得最慢的那部分请求从尾部消失"""
+    latencies = np.array([s[1] for s in samples if s[2] in ("ok", "miss", "unfinished")]) * 1000
+    total = len(samples)
+    errors = sum(1 for s in samples if s[2] == "error")
+    ok = sum(1 for s in samples if s[2] == "ok")
+    dropped = sum(1 for s in samples if s[2] == "dropped")
+    unfinished = sum(1 for s in samples if s[2] == "unfinished")
+    completed = total - dropped - unfinished
+
+    def pct(q):
+        return round(float(np.percentile(latencies, q)), 2) if len(latencies) else None
+
+    return {
+        "requests": total,
+        "throughput_rps": round(completed / wall, 2) if wall > 0 else 0.0,
+        "latency_ms": {"p50": pct(50), "p95": pct(95), "p99": pct(99),
+                       "mean": round(float(latencies.mean()), 2) if len(latencies) else None,
+                       "max": round(float(latencies.max()), 2) if len(latencies) else None},
+        "error_rate": round(errors / completed, 4) if completed else 0.0,
+        "match_rate": round(ok / (completed - errors), 4) if completed - errors else 0.0,
+        "dropped": dropped,
+        "unfinished": unfinished,
+        "server_cpu_percent": round(cpu_seconds / wall * 100, 1) if cpu_seconds is not None and wall > 0 else None,
+        "wall_seconds": round(wall, 2),
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def save_result(result: dict, results_dir: str) -> str:
+    os.makedirs(results_dir, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(result["started_at"]))
+    path = os.path.join(results_dir, f"{stamp}_{result['label']}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def compare(results_dir: str):
+    """按时间顺序打印所有历史结果，便于对比"""
+    rows = []
+    for path in sorted(glob.glob(os.path.join(results_dir, "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            r = json.load(f)
+        cfg, m = r["config"], r["metrics"]
+        load = f"c={cfg['concurrency']}" if cfg["concurrency"] else f"r={cfg['rate']}/s"
+        rows.append((r["label"], r.get("git_rev") or "-", load, str(cfg["workers"]), f"{m['throughput_rps']:.1f}",
+                     str(m["latency_ms"]["p50"]), str(m["latency_ms"]["p95"]), str(m["latency_ms"]["p99"]),
+                     f"{m['error_rate'] * 100:.1f}%", str(m.get("dropped", 0)), str(m["server_cpu_percent"])))
+    if not rows:
+        print(f"{results_dir} 中没有结果")
+        return
+    header = ("label", "rev", "load", "workers", "rps", "p50ms", "p95ms", "p99ms", "errors", "dropped", "cpu%")
+    widths = [max(len(x) for x in col) for col in zip(header, *rows)]
+    for row in [header] + rows:
+        print("  ".join(v.ljust(w) for v, w in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="视觉服务器压测")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--concurrency", type=int, default=None, help="固定并发数 (默认 4)")
+    load.add_argument("--rate", type=float, default=None, help="固定到达率 (请求/秒)")
+    parser.add_argument("--duration", type=float, default=30.0, help="压测时长 (秒)")
+    parser.add_argument("--requests", type=int, default=None, help="最多发送的请求数")
+    parser.add_argument("--warmup", type=int, default=5, help="预热请求数 (不计入结果)")
+    parser.add_argument("--max-inflight", type=int, default=64,
+                        help="固定到达率模式下的最大未完成请求数，超出时新请求记为 dropped")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker 进程数")
+    parser.add_argument("--pairs", default=None, help="录制的图片对目录")
+    parser.add_argument("--label", default="run", help="结果标签")
+    parser.add_argument("--results-dir", default=RESULTS_DIR)
+    parser.add_argument("--compare", action="store_true", help="只打印历史结果对比")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.results_dir)
+        return
+    if args.concurrency is None and args.rate is None:
+        args.concurrency = 4
+
+    pairs = load_pairs(args.pairs) if args.pairs else synthesize_pairs()
+    if not pairs:
+        raise SystemExit("没有可用的图片对")
+    logger.info(f"📦 载入 {len(pairs)} 组图片对 ({'录制' if args.pairs else '合成'})")
+
+    port = free_port()
+    server = start_server(port, args.workers)
+    try:
+        url = f"http://127.0.0.1:{port}/vision/process"
+        gen = LoadGenerator(url, pairs, pool_size=max(args.concurrency or 0, args.max_inflight))
+        for _ in range(args.warmup):
+            gen.send_one()
+        gen.samples.clear()
+
+        cpu = CpuSampler(server.pid)
+        cpu_start = cpu.cpu_seconds()
+        started_at = time.time()
+        mode = f"并发 {args.concurrency}" if args.concurrency else f"到达率 {args.rate}/s"
+        logger.info(f"🚀 开始压测: {mode}, 时长 {args.duration}s")
+        if args.concurrency:
+            gen.run_closed_loop(args.concurrency, args.duration, args.requests)
+        else:
+            gen.run_open_loop(args.rate, args.duration, args.requests, args.max_inflight)
+        wall = time.time() - started_at
+        cpu_end = cpu.cpu_seconds()
+    finally:
+        stop_server(server)
+
+    cpu_used = cpu_end - cpu_start if cpu_start is not None and cpu_end is not None else None
+    result = {
+        "label": args.label,
+        "started_at": started_at,
+        "git_rev": git_revision(),
+        "config": {"concurrency": args.concurrency, "rate": args.rate, "duration": args.duration,
+                   "requests": args.requests, "max_inflight": args.max_inflight, "workers": args.workers,
+                   "pairs": args.pairs or "synthetic", "pair_count": len(pairs)},
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpu_count": os.cpu_count(), "opencv": cv2.__version__},
+        "metrics": summarize(gen.samples, wall, cpu_used),
+    }
+    path = save_result(result, args.results_dir)
+    print(json.dumps(result["metrics"], ensure_ascii=False, indent=2))
+    logger.info(f"💾 结果已保存: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# -*- encoding=utf8 -*-
+# SharedFFTMatcher 与 cv2.TM_CCOEFF_NORMED 的一致性测试: python -m pytest tests
+import os
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from client import SharedFFTMatcher  # noqa: E402
+
+
+def make_frame(h=400, w=300, seed=0):
+    rng = np.random.default_rng(seed)
+    frame = cv2.GaussianBlur((rng.random((h, w)) * 255).astype(np.uint8), (7, 7), 2)
+    frame[:120, :] = 200   # 纯色区域
+    return frame
+
+
+def register_crops(matcher, frame):
+    crops = {"a": frame[200:240, 100:160], "b": frame[250:300, 30:130], "c": frame[300:340, 180:260]}
+    for name, crop in crops.items():
+        matcher.register(name, crop.copy())
+    return crops
+
+
+def test_shared_fft_matches_cv2():
+    frame = make_frame()
+    matcher = SharedFFTMatcher(cache_mb=64, min_template_ratio=0)
+    crops = register_crops(matcher, frame)
+
+    results = matcher.match(frame, list(crops))
+    assert matcher._spectra, "多模板应走共享 FFT"
+    for name, crop in crops.items():
+        expected = cv2.matchTemplate(frame, crop, cv2.TM_CCOEFF_NORMED)
+        assert results[name].shape == expected.shape
+        np.testing.assert_allclose(results[name], expected, atol=1e-3)
+        # 完全落在纯色区域里的窗口响应为 0
+        h = crop.shape[0]
+        assert not np.any(results[name][:120 - h + 1])
+
+
+def test_flat_template_gives_zero():
+    frame = make_frame()
+    matcher = SharedFFTMatcher(cache_mb=64, min_template_ratio=0)
+    register_crops(matcher, frame)
+    matcher.register("flat", np.full((30, 40), 77, np.uint8))
+
+    # 单模板 (cv2 路径) 和多模板 (FFT 路径) 都不能把纯色模板当成命中
+    single = matcher.match(frame, ["flat"])["flat"]
+    shared = matcher.match(frame, ["a", "flat"])["flat"]
+    assert single.shape == shared.shape == (400 - 30 + 1, 300 - 40 + 1)
+    assert not np.any(single) and not np.any(shared)
+
+
+def test_single_and_uncached_templates_use_match_template():
+    frame = make_frame()
+    matcher = SharedFFTMatcher(cache_mb=0, min_template_ratio=0)
+    crops = register_crops(matcher, frame)
+
+    results = matcher.match(frame, list(crops))
+    assert not matcher._spectra
+    for name, crop in crops.items():
+        np.testing.assert_array_equal(results[name], cv2.matchTemplate(frame, crop, cv2.TM_CCOEFF_NORMED))
+
+
+def test_band_and_cache_bound():
+    frame = make_frame()
+    # 只够放两份条带频谱
+    fft_shape = (cv2.getOptimalDFTSize(150), cv2.getOptimalDFTSize(300))
+    matcher = SharedFFTMatcher(cache_mb=1, min_template_ratio=0)
+    matcher.cache_bytes = 2 * fft_shape[0] * fft_shape[1] * 4
+    crops = register_crops(matcher, frame)
+
+    results = matcher.match(frame, list(crops), band=(190, 340))
+    assert matcher._spectra_bytes <= matcher.cache_bytes
+    assert len(matcher._spectra) == 2
+    for name, crop in crops.items():
+        expected = cv2.matchTemplate(frame[190:340], crop, cv2.TM_CCOEFF_NORMED)
+        np.testing.assert_allclose(results[name], expected, atol=1e-3)
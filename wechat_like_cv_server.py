@@ -1,14 +1,17 @@
 # -*- coding: utf-8 -*-
 # wechat-like-cv-server.py - 视觉计算中心（添加调试信息）
+import os
 import uvicorn
 import cv2
 import numpy as np
 import time
 import logging
 from fastapi import FastAPI, File, UploadFile, Form
+from async_logging import setup_logging, SAMPLED
 
-# 日志配置（更详细）
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - [SERVER] - %(levelname)s - %(message)s')
+# 日志配置：后台线程写出，逐请求日志限流；需要调试时设置环境变量 VISION_LOG_LEVEL=DEBUG
+LOG_LEVEL = os.environ.get("VISION_LOG_LEVEL", "INFO").upper()
+setup_logging(level=LOG_LEVEL, fmt='%(asctime)s - [SERVER] - %(levelname)s - %(message)s')
 logger = logging.getLogger("VisionServer")
 
 app = FastAPI()
@@ -21,20 +24,20 @@ flann_matcher = cv2.FlannBasedMatcher(index_params, search_params)
 def algorithm_sift(template_img, target_img):
     """SIFT 特征匹配，返回中心坐标和外接矩形"""
     t0 = time.time()
-    logger.debug("开始 SIFT 匹配...")
+    logger.debug("开始 SIFT 匹配...", extra=SAMPLED)
     
     # 1. 检测特征点
     kp1, des1 = sift_engine.detectAndCompute(template_img, None)
     kp2, des2 = sift_engine.detectAndCompute(target_img, None)
     
     if des1 is None or des2 is None or len(kp1) < 5:
-        logger.warning("特征点不足，无法匹配")
+        logger.warning("特征点不足，无法匹配", extra=SAMPLED)
         return None
     
     # 2. KNN 匹配
     matches = flann_matcher.knnMatch(des1, des2, k=2)
     good_matches = [m for m, n in matches if m.distance < 0.75 * n.distance]
-    logger.debug(f"好匹配点数: {len(good_matches)}")
+    logger.debug("好匹配点数: %d", len(good_matches), extra=SAMPLED)
     
     # 3. 单应性矩阵计算 (至少6个点)
     if len(good_matches) >= 6:
@@ -56,10 +59,10 @@ def algorithm_sift(template_img, target_img):
             cx = int(np.mean(x_coords))
             cy = int(np.mean(y_coords))
             
-            logger.info(f"SIFT 匹配成功 | 耗时: {(time.time()-t0)*1000:.1f}ms | 位置: ({cx}, {cy})")
+            logger.info("SIFT 匹配成功 | 耗时: %.1fms | 位置: (%d, %d)", (time.time()-t0)*1000, cx, cy, extra=SAMPLED)
             return {"pos": [cx, cy], "rect": rect}
             
-    logger.warning("单应性矩阵计算失败")
+    logger.warning("单应性矩阵计算失败", extra=SAMPLED)
     return None
 
 @app.post("/vision/process")
@@ -68,34 +71,36 @@ async def process_image(
     target: UploadFile = File(...), 
     template: UploadFile = File(None)
 ):
-    logger.info(f"接收到 HTTP 请求 | 模式: {mode}")
+    logger.debug("接收到 HTTP 请求 | 模式: %s", mode, extra=SAMPLED)
     try:
         # 读取上传图片
         target_bytes = await target.read()
         img_target = cv2.imdecode(np.frombuffer(target_bytes, np.uint8), cv2.IMREAD_COLOR)
         img_target_gray = cv2.cvtColor(img_target, cv2.COLOR_BGR2GRAY)
-        logger.debug(f"目标图像尺寸: {img_target.shape}")
+        logger.debug("目标图像尺寸: %s", img_target.shape, extra=SAMPLED)
         
         result = {"success": False}
         
         if mode == 'sift' and template:
             tpl_bytes = await template.read()
             img_tpl = cv2.imdecode(np.frombuffer(tpl_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
-            logger.debug(f"模板图像尺寸: {img_tpl.shape}")
+            logger.debug("模板图像尺寸: %s", img_tpl.shape, extra=SAMPLED)
             
             data = algorithm_sift(img_tpl, img_target_gray)
             if data:
                 result = {"success": True, "data": data}
-                logger.info("处理成功，返回结果")
+                logger.debug("处理成功，返回结果", extra=SAMPLED)
             else:
-                logger.warning("SIFT 匹配失败")
+                logger.warning("SIFT 匹配失败", extra=SAMPLED)
                 
         return result
     except Exception as e:
-        logger.error(f"处理错误: {e}")
+        logger.error("处理错误: %s", e, extra=SAMPLED)
         return {"success": False, "error": str(e)}
 
 if __name__ == "__main__":
     logger.info("🚀 启动视觉服务器...")
-    uvicorn.run(app, host="0.0.0.0", port=9000, log_level="debug")
+    # 访问日志在事件循环里同步逐条写出，默认关闭；需要时设置 VISION_ACCESS_LOG=1
+    uvicorn.run(app, host="0.0.0.0", port=9000, log_level=LOG_LEVEL.lower(),
+                access_log=os.environ.get("VISION_ACCESS_LOG") == "1")
     logger.info("服务器运行中...")
\ No newline at end of file